@@ -1,5 +1,13 @@
+import os
+
+# 작은 영역 OCR에서는 Tesseract 내부 OpenMP 스레드가 오히려 느리므로 단일 스레드로 고정합니다.
+# (Tesseract 프로세스/라이브러리가 로드되기 전에 설정되어야 함)
+os.environ.setdefault('OMP_THREAD_LIMIT', '1')
+
+from concurrent.futures import ThreadPoolExecutor
 from pynput import keyboard
 from mss import mss
+import numpy as np
 import pytesseract
 from PIL import Image
 import pyautogui
@@ -7,8 +15,16 @@ try:
     import pyperclip
 except ImportError:
     pyperclip = None
+try:
+    from tesserocr import PyTessBaseAPI, PSM, OEM
+except ImportError:
+    PyTessBaseAPI = None
+import bisect
+import ctypes
 import re
 import platform
+import queue
+import threading
 import time
 
 # ----------------- 1. 사용자 설정 영역 (필수) -----------------
@@ -16,7 +32,9 @@ import time
 TESSERACT_PATH = r'C:/Program Files/Tesseract-OCR/tesseract.exe'
 RESULT_INPUT_COORD = (970, 886)  # 점수 및 등급을 입력할 대상 좌표
 INPUT_CLICK_DELAY = 0.35
-INPUT_TYPING_INTERVAL = 0.02
+INPUT_TYPING_INTERVAL = 0  # 키보드 입력 대체 경로의 글자 간 대기(초). 대상 프로그램이 글자를 놓치면 0.02 정도로 늘리세요.
+OCR_UPSCALE = 3  # OCR 전 ROI 확대 배율 (24~29px 높이의 숫자를 Tesseract 권장 글자 크기에 맞춤)
+RELEASE_TIMEOUT = 5  # 종료 시 작업 스레드별 자원 해제를 기다리는 최대 시간(초)
 
 # **1번 패턴 (CT 기기 1)의 점수 영역 좌표**: '1. 화면 좌표 추출기'로 찾은 값
 ROI_1 = {
@@ -30,12 +48,180 @@ ROI_2 = {
 }
 # -------------------------------------------------------------
 
+# OCR 결과에서 점수를 찾는 정규식 (호출마다 컴파일하지 않도록 모듈 로드 시 한 번만 생성)
+_NUMBER_RE = re.compile(r'\d+(?:\.\d+)?')
+# mss가 주는 BGRA 픽셀의 B, G, R 채널 휘도 가중치 (PIL 'L' 변환과 동일한 ITU-R 601 계수)
+_GRAY_WEIGHTS = np.array([0.114, 0.587, 0.299], dtype=np.float32)
+# 점수 등급별 하한/상한 (양 끝 포함: 0 / 1~10 / 11~100 / 101~400, 마지막 등급은 400 초과 전체)과 등급 문구
+# 등급 사이의 소수 점수(예: 0.3, 10.7)는 어느 등급에도 넣지 않고 알 수 없는 점수 범위로 처리
+_SCORE_LOWS = (0, 1, 11, 101)
+_SCORE_HIGHS = (0, 10, 100, 400)
+_SCORE_LABELS = (
+    "관상동맥혈관벽에 석회화 침착 없음",
+    "경도의 관상동맥 석회화",
+    "중등도의 관상동맥 석회화",
+    "중고등도의 관상동맥 석회화",
+    "고도의 관상동맥 석회화",
+)
+
+
+def _otsu_threshold(hist):
+    """256단계 그레이스케일 히스토그램에서 Otsu 임계값을 계산합니다."""
+    hist = hist.astype(np.float64)
+    weight_bg = np.cumsum(hist)
+    weight_fg = weight_bg[-1] - weight_bg
+    sum_bg = np.cumsum(hist * np.arange(256))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean_bg = sum_bg / weight_bg
+        mean_fg = (sum_bg[-1] - sum_bg) / weight_fg
+        variance = weight_bg * weight_fg * (mean_bg - mean_fg) ** 2
+    return int(np.argmax(np.nan_to_num(variance)))
+
+
+# Windows SendInput 구조체 (클립보드를 쓸 수 없을 때 문자열 전체를 한 번의 호출로 입력)
+# wintypes는 Windows 외 환경에서 가져오기에 실패할 수 있으므로 Windows에서만 정의
+if platform.system() == "Windows":
+    from ctypes import wintypes
+
+    _INPUT_KEYBOARD = 1
+    _KEYEVENTF_KEYUP = 0x0002
+    _KEYEVENTF_UNICODE = 0x0004
+    _VK_RETURN = 0x0D
+
+    class _MOUSEINPUT(ctypes.Structure):
+        _fields_ = [
+            ('dx', wintypes.LONG),
+            ('dy', wintypes.LONG),
+            ('mouseData', wintypes.DWORD),
+            ('dwFlags', wintypes.DWORD),
+            ('time', wintypes.DWORD),
+            ('dwExtraInfo', ctypes.c_size_t),
+        ]
+
+    class _KEYBDINPUT(ctypes.Structure):
+        _fields_ = [
+            ('wVk', wintypes.WORD),
+            ('wScan', wintypes.WORD),
+            ('dwFlags', wintypes.DWORD),
+            ('time', wintypes.DWORD),
+            ('dwExtraInfo', ctypes.c_size_t),
+        ]
+
+    class _INPUTUNION(ctypes.Union):
+        # INPUT 구조체 크기를 맞추기 위해 가장 큰 MOUSEINPUT도 포함
+        _fields_ = [('mi', _MOUSEINPUT), ('ki', _KEYBDINPUT)]
+
+    class _INPUT(ctypes.Structure):
+        _fields_ = [('type', wintypes.DWORD), ('union', _INPUTUNION)]
+
+
+def _send_unicode_text(text):
+    """Windows SendInput으로 문자열 전체를 한 번에 입력합니다. 지원하지 않거나 하나도 입력하지 못하면 False를 반환합니다."""
+    if platform.system() != "Windows":
+        return False
+
+    inputs = []
+    for char in text:
+        if char == '\r':
+            continue
+        if char == '\n':
+            # 줄바꿈은 유니코드 문자 대신 Enter 키로 입력
+            keys = [(_VK_RETURN, 0, 0), (_VK_RETURN, 0, _KEYEVENTF_KEYUP)]
+        else:
+            # BMP 밖의 문자는 UTF-16 서로게이트 쌍으로 나누어 입력
+            encoded = char.encode('utf-16-le')
+            keys = []
+            for i in range(0, len(encoded), 2):
+                unit = int.from_bytes(encoded[i:i + 2], 'little')
+                keys.append((0, unit, _KEYEVENTF_UNICODE))
+                keys.append((0, unit, _KEYEVENTF_UNICODE | _KEYEVENTF_KEYUP))
+        for vk, scan, flags in keys:
+            inputs.append(_INPUT(type=_INPUT_KEYBOARD, union=_INPUTUNION(ki=_KEYBDINPUT(wVk=vk, wScan=scan, dwFlags=flags))))
+
+    if not inputs:
+        return True
+    array = (_INPUT * len(inputs))(*inputs)
+    sent = ctypes.windll.user32.SendInput(len(inputs), array, ctypes.sizeof(_INPUT))
+    if 0 < sent < len(inputs):
+        # 일부만 입력된 뒤 다시 입력하면 글자가 중복되므로 대체 경로로 넘기지 않음
+        print(f"[WARN] 키 입력 {len(inputs)}개 중 {sent}개만 전달되었습니다. 입력 필드를 확인하세요.")
+    return sent > 0
+
 
 class AgatstonScoreMaster:
     def __init__(self, tesseract_path, rois):
         # Tesseract 경로 설정 (사전 준비 필수)
         pytesseract.pytesseract.tesseract_cmd = tesseract_path
         self.rois = rois
+        self._tesseract_path = tesseract_path
+        # 모니터 배치는 실행 중 바뀌지 않으므로 시작 시 한 번만 조회 (단축키마다 모니터 정보를 다시 읽지 않도록)
+        with mss() as sct:
+            self._monitors = sct.monitors
+        # 모니터 배치와 ROI는 실행 중 바뀌지 않으므로 실제 좌표를 미리 계산 (잘못된 모니터 번호는 시작 시 바로 오류)
+        self._resolved_rois = tuple(self._prepare_roi(roi, self._monitors) for roi in rois)
+        # 화면 캡처 객체와 tesserocr 엔진은 스레드 간 공유가 안전하지 않으므로 스레드마다 하나씩 만들어 재사용
+        # (단축키마다 장치 컨텍스트를 다시 만들거나 OCR마다 tesseract 프로세스를 띄우지 않도록)
+        self._local = threading.local()
+        self._resources = []
+        self._resources_lock = threading.Lock()
+        # ROI들을 동시에 추출하기 위한 작업 스레드 (스레드가 유지되므로 스레드별 객체도 계속 재사용됨)
+        self._pool = ThreadPoolExecutor(max_workers=len(self._resolved_rois))
+        # 단축키 콜백은 작업 요청만 넣고 바로 반환 (키보드 리스너 스레드가 추출 작업 동안 막히지 않도록)
+        self._jobs = queue.Queue(maxsize=1)
+        self._worker = threading.Thread(target=self._work_loop, daemon=True)
+        self._worker.start()
+
+    def request_extraction(self):
+        """단축키 리스너에서 호출: 점수 추출 작업을 작업 스레드에 요청합니다."""
+        try:
+            self._jobs.put_nowait(True)
+        except queue.Full:
+            # 이미 대기 중인 요청이 있으면 무시 (연타로 같은 작업이 쌓이지 않도록)
+            pass
+
+    def _work_loop(self):
+        """작업 스레드: 요청이 들어올 때마다 점수 추출을 수행합니다."""
+        while True:
+            job = self._jobs.get()
+            if job is None:
+                return
+            try:
+                self.on_hotkey_press()
+            except Exception as exc:
+                print(f"[WARN] 점수 추출 중 오류가 발생했습니다: {exc}")
+
+            # 처리 중에 눌린 단축키는 무시 (작업이 끝난 뒤 같은 추출이 한 번 더 실행되지 않도록)
+            try:
+                if self._jobs.get_nowait() is None:
+                    return
+            except queue.Empty:
+                pass
+
+    def _thread_resources(self):
+        """현재 스레드 전용 (mss, tesserocr 엔진)을 반환하고, 없으면 생성합니다."""
+        resources = getattr(self._local, 'resources', None)
+        if resources is None:
+            resources = (mss(), self._create_tess_api(self._tesseract_path))
+            self._local.resources = resources
+            with self._resources_lock:
+                self._resources.append(resources)
+        return resources
+
+    def _create_tess_api(self, tesseract_path):
+        """상주 tesserocr 엔진을 생성합니다. 사용할 수 없으면 None을 반환합니다."""
+        if PyTessBaseAPI is None:
+            return None
+
+        tessdata_path = os.path.join(os.path.dirname(tesseract_path), 'tessdata')
+        try:
+            api = PyTessBaseAPI(path=tessdata_path, lang='eng', psm=PSM.SINGLE_LINE, oem=OEM.LSTM_ONLY)
+        except RuntimeError as exc:
+            print(f"[WARN] tesserocr 초기화에 실패했습니다: {exc}. pytesseract로 대체합니다.")
+            return None
+        api.SetVariable('tessedit_char_whitelist', '0123456789.')
+        # 전처리에서 흰 바탕/검은 글자로 맞추므로 반전 재인식 생략
+        api.SetVariable('tessedit_do_invert', '0')
+        return api
 
     def _prepare_roi(self, roi, monitors):
         """모니터 기준 ROI 정보를 실제 좌표계로 변환합니다."""
@@ -57,31 +243,100 @@ class AgatstonScoreMaster:
             'height': region['height'],
         }
 
-    def _extract_from_roi(self, roi):
-        """단일 ROI에서 스크린샷, 전처리, OCR을 수행하여 점수를 추출합니다."""
-        with mss() as sct:
-            monitors = sct.monitors
-            region = self._prepare_roi(roi, monitors)
-            sct_img = sct.grab(region)
-        img = Image.frombytes("RGB", sct_img.size, sct_img.bgra, "raw", "BGRX")
+    def _extract_from_roi(self, region):
+        """실제 좌표로 변환된 단일 ROI에서 스크린샷, 전처리, OCR을 수행하여 점수를 추출합니다."""
+        sct, tess = self._thread_resources()
+        sct_img = sct.grab(region)
 
         # 이미지 전처리: 그레이스케일 변환 (OCR 정확도 향상)
-        processed_img = img.convert('L')
+        # BGRA 원본 버퍼를 복사 없이 배열로 보고 RGB 재배열 없이 한 번에 휘도를 계산
+        bgra = np.frombuffer(sct_img.raw, dtype=np.uint8).reshape(sct_img.height, sct_img.width, 4)
+        gray = (bgra[..., :3] @ _GRAY_WEIGHTS).astype(np.uint8)
+        processed_img = Image.fromarray(self._binarize(gray), 'L')
 
-        # OCR 실행: 숫자만 인식하도록 설정 (--psm 7: 단일 텍스트 라인)
-        custom_config = r'--oem 3 --psm 7 -c tessedit_char_whitelist=0123456789.'
-        text = pytesseract.image_to_string(processed_img, config=custom_config).strip()
+        text = self._ocr_digits(tess, processed_img).strip()
 
         # 추출된 텍스트에서 숫자만 정리하고 정수로 반환
-        numbers = re.findall(r'\d+(?:\.\d+)?', text)
-        if not numbers:
+        match = _NUMBER_RE.search(text)
+        if match is None:
             return None
 
-        score_value = float(numbers[0])
+        score_value = float(match.group())
         if score_value.is_integer():
             return int(score_value)
         return score_value
 
+    def _binarize(self, gray):
+        """Otsu 이진화 후 확대하여 흰 바탕에 검은 숫자인 OCR 입력을 만듭니다."""
+        # 최근접 확대는 히스토그램 비율을 바꾸지 않으므로 임계값과 극성은 원본 크기에서 계산
+        hist = np.bincount(gray.ravel(), minlength=256)
+        threshold = _otsu_threshold(hist)
+        bright_levels = np.arange(256) > threshold
+        if hist[bright_levels].sum() * 2 < gray.size:
+            # 어두운 바탕에 밝은 숫자 → 밝은 픽셀을 검은 글자로
+            lut = np.where(bright_levels, 0, 255).astype(np.uint8)
+        else:
+            lut = np.where(bright_levels, 255, 0).astype(np.uint8)
+        # 임계값 비교와 극성 반전을 256칸 변환표 한 번의 조회로 처리 (픽셀 배열은 한 번만 순회)
+        binary = lut[gray]
+
+        if OCR_UPSCALE > 1:
+            binary = binary.repeat(OCR_UPSCALE, axis=0).repeat(OCR_UPSCALE, axis=1)
+        return binary
+
+    def _ocr_digits(self, tess, image):
+        """숫자 전용 OCR을 실행합니다 (상주 tesserocr 엔진 우선, 없으면 pytesseract)."""
+        if tess is not None:
+            tess.SetImage(image)
+            return tess.GetUTF8Text()
+
+        # OCR 실행: 숫자만 인식하도록 설정 (--oem 1: LSTM 엔진만 사용, --psm 7: 단일 텍스트 라인)
+        custom_config = r'--oem 1 --psm 7 -c tessedit_char_whitelist=0123456789. -c tessedit_do_invert=0'
+        return pytesseract.image_to_string(image, config=custom_config)
+
+    def _release_thread_resources(self, barrier):
+        """작업 스레드에서 실행: 현재 스레드가 만든 화면 캡처 객체와 OCR 엔진을 해제합니다."""
+        resources = getattr(self._local, 'resources', None)
+        if resources is not None:
+            del self._local.resources
+            with self._resources_lock:
+                self._resources.remove(resources)
+            self._release_resources(resources)
+
+        # 모든 작업 스레드가 정리 작업을 하나씩 맡도록 대기 (한 스레드가 두 번 가져가지 않게)
+        try:
+            barrier.wait(timeout=RELEASE_TIMEOUT)
+        except threading.BrokenBarrierError:
+            pass
+
+    def _release_resources(self, resources):
+        """(mss, tesserocr 엔진) 한 쌍을 해제합니다. 하나가 실패해도 나머지는 계속 해제합니다."""
+        sct, tess = resources
+        try:
+            sct.close()
+        except Exception as exc:
+            print(f"[WARN] 화면 캡처 객체 해제에 실패했습니다: {exc}")
+        if tess is not None:
+            tess.End()
+
+    def close(self):
+        """작업 스레드와 스레드별 화면 캡처 객체, OCR 엔진을 해제합니다."""
+        self._jobs.put(None)
+        self._worker.join()
+
+        # Windows의 mss는 장치 컨텍스트를 생성한 스레드에 보관하므로 각 작업 스레드에서 직접 해제
+        workers = len(self._resolved_rois)
+        barrier = threading.Barrier(workers)
+        for _ in range(workers):
+            self._pool.submit(self._release_thread_resources, barrier)
+        self._pool.shutdown(wait=True)
+
+        # 작업 스레드에서 해제하지 못한 나머지는 여기서 하나씩 해제
+        with self._resources_lock:
+            leftovers, self._resources = self._resources, []
+        for resources in leftovers:
+            self._release_resources(resources)
+
     def _input_result_to_target(self, score_value, classification_text):
         """지정된 좌표에 점수와 등급을 자동으로 입력합니다."""
         if not RESULT_INPUT_COORD:
@@ -101,6 +356,8 @@ class AgatstonScoreMaster:
                 pyautogui.hotkey("ctrl", "a")
             pyautogui.press("backspace")
 
+            # 클립보드 붙여넣기를 우선 사용하고, 실패할 때만 키보드 입력으로 대체
+            pasted = False
             if pyperclip is not None:
                 try:
                     pyperclip.copy(message)
@@ -108,42 +365,45 @@ class AgatstonScoreMaster:
                         pyautogui.hotkey("command", "v")
                     else:
                         pyautogui.hotkey("ctrl", "v")
+                    pasted = True
                 except Exception as clip_exc:
                     print(f"[WARN] 클립보드 붙여넣기에 실패했습니다: {clip_exc}. 키보드 입력으로 대체합니다.")
-                    pyautogui.write(message, interval=INPUT_TYPING_INTERVAL)
-            else:
-                pyautogui.write(message, interval=INPUT_TYPING_INTERVAL)
+            if not pasted:
+                self._type_text(message)
         except Exception as exc:
             print(f"[WARN] 자동 입력에 실패했습니다: {exc}")
 
+    def _type_text(self, message):
+        """클립보드를 쓸 수 없을 때 키보드 입력으로 문자열을 입력합니다."""
+        # Windows는 SendInput 한 번으로 전체 문자열(한글 포함)을 입력하여 글자마다 대기하지 않음
+        if _send_unicode_text(message):
+            return
+        pyautogui.write(message, interval=INPUT_TYPING_INTERVAL)
+
     def _classify_score(self, score):
         """점수를 요청하신 5등급으로 분류하고 실제 점수를 문자열에 포함합니다."""
         score_value = float(score)
         score_str = f"{score_value:g}"
 
-        if score_value == 0:
-            detail = "관상동맥혈관벽에 석회화 침착 없음"
-        elif 1 <= score_value <= 10:
-            detail = "경도의 관상동맥 석회화"
-        elif 11 <= score_value <= 100:
-            detail = "중등도의 관상동맥 석회화"
-        elif 101 <= score_value <= 400:
-            detail = "중고등도의 관상동맥 석회화"
-        elif score_value > 400:
-            detail = "고도의 관상동맥 석회화"
-        else:
+        # 점수를 상한으로 포함하는 첫 등급을 찾고, 그 등급의 하한보다 작으면 등급 사이 값
+        band = bisect.bisect_left(_SCORE_HIGHS, score_value)
+        if band < len(_SCORE_LOWS) and score_value < _SCORE_LOWS[band]:
             return "알 수 없는 점수 범위"
 
+        detail = _SCORE_LABELS[band]
         return f"*****\n{detail} (coronary arterial calcium scoring : {score_str})\n\n"
 
     def on_hotkey_press(self):
         """'=' 키 감지 시 실행될 메인 로직입니다."""
         print("'=' 키 감지됨. 점수 추출 시작...")
 
-        # ROI_1 먼저 시도, 실패 시 ROI_2 시도 (두 가지 패턴 처리)
-        score = self._extract_from_roi(self.rois[0])
-        if score is None:
-            score = self._extract_from_roi(self.rois[1])
+        # ROI_1, ROI_2를 동시에 추출하고 ROI_1 결과를 우선 사용 (두 가지 패턴 처리)
+        futures = [self._pool.submit(self._extract_from_roi, region) for region in self._resolved_rois]
+        score = None
+        for future in futures:
+            score = future.result()
+            if score is not None:
+                break
 
         # 결과 처리 및 표시
         if score is not None:
@@ -162,13 +422,16 @@ def start_listener():
     master = AgatstonScoreMaster(TESSERACT_PATH, [ROI_1, ROI_2])
 
     def on_activate():
-        master.on_hotkey_press()
+        master.request_extraction()
 
     print("'=' 키를 누르면 Agatston 점수 추출을 시도합니다.")
     print("프로그램 종료는 Ctrl+C 또는 창을 닫아주세요.")
 
-    with keyboard.GlobalHotKeys({'=': on_activate}) as listener:
-        listener.join()
+    try:
+        with keyboard.GlobalHotKeys({'=': on_activate}) as listener:
+            listener.join()
+    finally:
+        master.close()
 
 
 if __name__ == "__main__":
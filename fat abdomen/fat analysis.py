@@ -5,23 +5,120 @@ CT 복부지방 자동 판독 프로그램
 - 판독지 자동 입력
 """
 
+import os
+
+# 작은 영역 OCR에서는 Tesseract 내부 OpenMP 스레드가 오히려 느리므로 단일 스레드로 고정합니다.
+# (Tesseract 프로세스/라이브러리가 로드되기 전에 설정되어야 함)
+os.environ.setdefault('OMP_THREAD_LIMIT', '1')
+
 import pyautogui
 import pytesseract
-from PIL import Image, ImageGrab
+from PIL import Image
+from mss import mss
+import bisect
 import re
 import keyboard
 import tkinter as tk
 from tkinter import messagebox
 import threading
+import queue
+try:
+    from tesserocr import PyTessBaseAPI, PSM, OEM
+except ImportError:
+    PyTessBaseAPI = None
 
 
 # ==================== 설정 ====================
 # Tesseract 경로 설정 (설치 경로에 맞게 수정)
-pytesseract.pytesseract.tesseract_cmd = r'C:\Program Files\Tesseract-OCR\tesseract.exe'
+TESSERACT_PATH = r'C:\Program Files\Tesseract-OCR\tesseract.exe'
+pytesseract.pytesseract.tesseract_cmd = TESSERACT_PATH
+# tesserocr 사용 시 학습 데이터 경로 (기본: Tesseract 설치 폴더의 tessdata)
+TESSDATA_PATH = os.path.join(os.path.dirname(TESSERACT_PATH), 'tessdata')
 
 # 지방값이 출력되는 두 영역의 좌표 (실제 화면에 맞게 조정 필요)
 REGION_1 = (1526, 377, 1639, 387)  # (x1, y1, x2, y2)
 REGION_2 = (335, 678, 449, 687)
+# 두 영역을 감싸는 사각형 면적이 두 영역 면적 합의 이 배수 이하이면 한 번에 캡처
+BATCH_GRAB_MAX_RATIO = 4
+# OCR 전 확대 배율 (영역 높이가 10px 내외라 Tesseract 권장 글자 높이에 맞추기 위함)
+OCR_UPSCALE = 3
+# GUI 스레드가 다른 스레드의 요청을 확인하는 주기 (ms)
+TK_POLL_INTERVAL = 20
+# GUI 스레드가 Tk 루트를 만들 때까지 기다리는 최대 시간 (초)
+TK_START_TIMEOUT = 5
+
+# OCR 결과 정리용 변환표 (쉼표 제거, O/o → 0, 구분 문자는 공백) 및 숫자 정규식
+_OCR_CLEANUP = str.maketrans({',': '', 'O': '0', 'o': '0', ':': ' ', '㎟': ' '})
+_NUMBER_RE = re.compile(r'\d+(?:\.\d+)?')
+
+
+# ==================== GUI 스레드 ====================
+class TkDispatcher:
+    """숨겨진 Tk 루트 하나를 전용 스레드에서 유지하며 GUI 작업을 대신 실행하는 클래스
+
+    Tk는 스레드 간 공유가 안전하지 않으므로, 단축키마다 새 Tk 루트를 만드는 대신
+    모든 창을 이 스레드의 루트 아래 Toplevel로 생성합니다.
+    """
+
+    _root = None
+    _error = None
+    _thread = None
+    _tasks = queue.Queue()
+    _ready = threading.Event()
+    _lock = threading.Lock()
+
+    @staticmethod
+    def run(task):
+        """task(root)를 GUI 스레드에서 실행하도록 예약 (GUI를 시작할 수 없으면 RuntimeError)"""
+        with TkDispatcher._lock:
+            if TkDispatcher._thread is None:
+                TkDispatcher._thread = threading.Thread(target=TkDispatcher._main, daemon=True)
+                TkDispatcher._thread.start()
+        if not TkDispatcher._ready.wait(TK_START_TIMEOUT):
+            raise RuntimeError("GUI 스레드가 응답하지 않습니다.")
+        if TkDispatcher._root is None:
+            raise RuntimeError(f"GUI를 시작할 수 없습니다: {TkDispatcher._error}")
+        TkDispatcher._tasks.put(task)
+
+    @staticmethod
+    def _main():
+        """GUI 스레드: 루트를 한 번만 만들고 요청을 처리"""
+        try:
+            root = tk.Tk()
+            root.withdraw()
+            TkDispatcher._root = root
+        except Exception as e:
+            # 실패를 기록해 두고 대기 중인 스레드를 깨워 영원히 기다리지 않도록 함
+            TkDispatcher._error = e
+            return
+        finally:
+            TkDispatcher._ready.set()
+
+        TkDispatcher._poll()
+        root.mainloop()
+
+    @staticmethod
+    def _poll():
+        """대기 중인 GUI 작업 실행"""
+        root = TkDispatcher._root
+        while True:
+            try:
+                task = TkDispatcher._tasks.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                task(root)
+            except Exception as e:
+                print(f"GUI 작업 오류: {e}")
+        root.after(TK_POLL_INTERVAL, TkDispatcher._poll)
+
+    @staticmethod
+    def show_error(title, message):
+        """GUI 스레드에서 오류 메시지 상자 표시 (GUI를 쓸 수 없으면 콘솔에 출력)"""
+        try:
+            TkDispatcher.run(lambda root: messagebox.showerror(title, message, parent=root))
+        except RuntimeError as e:
+            print(f"{title}: {message} ({e})")
 
 
 class RegionVisualizer:
@@ -33,10 +130,7 @@ class RegionVisualizer:
         if not regions:
             return
 
-        def _show():
-            root = tk.Tk()
-            root.withdraw()
-
+        def _show(root):
             overlays = []
             for x1, y1, x2, y2 in regions:
                 width = max(1, x2 - x1)
@@ -55,39 +149,39 @@ class RegionVisualizer:
 
                 overlays.append(overlay)
 
-            root.after(duration, root.destroy)
-            root.mainloop()
+            def _hide():
+                for overlay in overlays:
+                    overlay.destroy()
 
-        threading.Thread(target=_show, daemon=True).start()
+            root.after(duration, _hide)
+
+        TkDispatcher.run(_show)
 
 
 # ==================== 비만도 분류 기준 ====================
+# 등급 문구와 각 등급의 하한 경계 (경계값은 위 등급에 포함)
+GRADE_LABELS = ("정상", "경증", "중등도", "중증")
+FAT_AREA_CUTS = (20000, 30000, 40000)  # 피하지방/내장지방 면적(㎟)
+OBESITY_RATIO_CUTS = (30, 40, 50)  # 내장/피하 비율(%)
+
+
 class ObesityClassifier:
     """비만도 분류 클래스"""
 
+    @staticmethod
+    def classify_fat_area(value):
+        """지방 면적 분류 (피하지방/내장지방 공통 기준)"""
+        return GRADE_LABELS[bisect.bisect_right(FAT_AREA_CUTS, value)]
+
     @staticmethod
     def classify_subcutaneous(value):
         """피하지방 분류"""
-        if value < 20000:
-            return "정상"
-        elif 20000 <= value < 30000:
-            return "경증"
-        elif 30000 <= value < 40000:
-            return "중등도"
-        else:
-            return "중증"
+        return ObesityClassifier.classify_fat_area(value)
 
     @staticmethod
     def classify_visceral(value):
         """내장지방 분류"""
-        if value < 20000:
-            return "정상"
-        elif 20000 <= value < 30000:
-            return "경증"
-        elif 30000 <= value < 40000:
-            return "중등도"
-        else:
-            return "중증"
+        return ObesityClassifier.classify_fat_area(value)
 
     @staticmethod
     def calculate_obesity_ratio(subcutaneous, visceral):
@@ -96,15 +190,7 @@ class ObesityClassifier:
             return 0, "계산불가"
 
         ratio = (visceral / subcutaneous) * 100
-
-        if ratio < 30:
-            grade = "정상"
-        elif 30 <= ratio < 40:
-            grade = "경증"
-        elif 40 <= ratio < 50:
-            grade = "중등도"
-        else:
-            grade = "중증"
+        grade = GRADE_LABELS[bisect.bisect_right(OBESITY_RATIO_CUTS, ratio)]
 
         return ratio, grade
 
@@ -113,26 +199,148 @@ class ObesityClassifier:
 class FatValueExtractor:
     """화면에서 지방 수치를 추출하는 클래스"""
 
+    # tesserocr 엔진은 한 번만 로드하여 재사용 (단축키마다 모델을 다시 읽지 않도록)
+    _api = None
+    _api_failed = False
+    _api_lock = threading.Lock()
+    # 화면 캡처 객체는 스레드마다 하나씩 만들어 재사용 (Windows의 mss는 생성한 스레드에서만 사용 가능)
+    _local = threading.local()
+
+    @staticmethod
+    def _get_api():
+        """상주 tesserocr 엔진 반환 (사용 불가 시 None, _api_lock 안에서 호출)"""
+        if PyTessBaseAPI is None or FatValueExtractor._api_failed:
+            return None
+
+        if FatValueExtractor._api is None:
+            try:
+                api = PyTessBaseAPI(path=TESSDATA_PATH, lang='eng', psm=PSM.SINGLE_BLOCK, oem=OEM.LSTM_ONLY)
+            except RuntimeError as e:
+                print(f"tesserocr 초기화 실패, pytesseract로 대체합니다: {e}")
+                FatValueExtractor._api_failed = True
+                return None
+            # pytesseract의 'digits' 설정과 동일한 문자 제한
+            api.SetVariable('tessedit_char_whitelist', '0123456789-.')
+            # 전처리에서 이미 흰 바탕/검은 글자로 맞추므로 반전 재인식 생략
+            api.SetVariable('tessedit_do_invert', '0')
+            FatValueExtractor._api = api
+
+        return FatValueExtractor._api
+
+    @staticmethod
+    def warm_up():
+        """OCR 엔진을 미리 로드 (첫 F12 분석 시 모델 로딩 대기 제거)"""
+        with FatValueExtractor._api_lock:
+            FatValueExtractor._get_api()
+
+    @staticmethod
+    def ocr_digits(image):
+        """이미지에서 숫자 텍스트 인식 (tesserocr가 없으면 pytesseract 사용)"""
+        with FatValueExtractor._api_lock:
+            api = FatValueExtractor._get_api()
+            if api is not None:
+                api.SetImage(image)
+                return api.GetUTF8Text()
+
+        return pytesseract.image_to_string(image, config='--psm 6 -c tessedit_do_invert=0 digits')
+
+    @staticmethod
+    def grab(region):
+        """(x1, y1, x2, y2) 영역을 현재 스레드의 mss 객체로 캡처하여 PIL 이미지로 반환"""
+        x1, y1, x2, y2 = region
+        sct = getattr(FatValueExtractor._local, 'sct', None)
+        if sct is None:
+            sct = FatValueExtractor._local.sct = mss()
+        raw = sct.grab({'left': x1, 'top': y1, 'width': x2 - x1, 'height': y2 - y1})
+        return Image.frombytes("RGB", raw.size, raw.bgra, "raw", "BGRX")
+
+    @staticmethod
+    def grab_regions(regions):
+        """여러 영역 캡처 (서로 가까우면 감싸는 사각형을 한 번만 캡처하여 잘라서 사용)"""
+        left = min(r[0] for r in regions)
+        top = min(r[1] for r in regions)
+        right = max(r[2] for r in regions)
+        bottom = max(r[3] for r in regions)
+
+        # 영역들이 멀리 떨어져 있으면 불필요한 화면까지 캡처하게 되므로 각각 캡처
+        bbox_area = (right - left) * (bottom - top)
+        total_area = sum((x2 - x1) * (y2 - y1) for x1, y1, x2, y2 in regions)
+        if bbox_area > total_area * BATCH_GRAB_MAX_RATIO:
+            return [FatValueExtractor.grab(region) for region in regions]
+
+        combined = FatValueExtractor.grab((left, top, right, bottom))
+        return [combined.crop((x1 - left, y1 - top, x2 - left, y2 - top)) for x1, y1, x2, y2 in regions]
+
+    @staticmethod
+    def _otsu_threshold(histogram):
+        """그레이스케일 히스토그램에서 Otsu 임계값 계산"""
+        total = sum(histogram)
+        sum_all = sum(i * count for i, count in enumerate(histogram))
+
+        sum_bg = 0
+        weight_bg = 0
+        best_threshold = 0
+        best_variance = -1.0
+        for i, count in enumerate(histogram):
+            weight_bg += count
+            if weight_bg == 0:
+                continue
+            weight_fg = total - weight_bg
+            if weight_fg == 0:
+                break
+
+            sum_bg += i * count
+            mean_bg = sum_bg / weight_bg
+            mean_fg = (sum_all - sum_bg) / weight_fg
+            variance = weight_bg * weight_fg * (mean_bg - mean_fg) ** 2
+            if variance > best_variance:
+                best_variance = variance
+                best_threshold = i
+
+        return best_threshold
+
+    @staticmethod
+    def preprocess(image):
+        """OCR 전처리: 그레이스케일 → 확대 → Otsu 이진화 (흰 바탕/검은 글자)"""
+        gray = image.convert('L')
+        if OCR_UPSCALE > 1:
+            gray = gray.resize((gray.width * OCR_UPSCALE, gray.height * OCR_UPSCALE), Image.LANCZOS)
+
+        histogram = gray.histogram()
+        threshold = FatValueExtractor._otsu_threshold(histogram)
+
+        # 어두운 픽셀이 절반을 넘으면 어두운 바탕에 밝은 글자이므로 반전
+        if sum(histogram[:threshold + 1]) * 2 > gray.width * gray.height:
+            return gray.point(lambda v: 0 if v > threshold else 255)
+        return gray.point(lambda v: 255 if v > threshold else 0)
+
+    @staticmethod
+    def close():
+        """상주 tesserocr 엔진과 현재 스레드의 화면 캡처 객체 해제 (캡처 객체를 만든 스레드에서 호출)"""
+        with FatValueExtractor._api_lock:
+            if FatValueExtractor._api is not None:
+                FatValueExtractor._api.End()
+                FatValueExtractor._api = None
+        sct = getattr(FatValueExtractor._local, 'sct', None)
+        if sct is not None:
+            del FatValueExtractor._local.sct
+            sct.close()
+
     @staticmethod
-    def extract_numbers_from_region(region):
-        """특정 영역에서 숫자 추출"""
+    def extract_numbers_from_region(region, screenshot=None):
+        """특정 영역에서 숫자 추출 (미리 캡처한 이미지가 있으면 그대로 사용)"""
         try:
             # 화면 캡처
-            screenshot = ImageGrab.grab(bbox=region)
-
-            # OCR로 텍스트 추출
-            text = pytesseract.image_to_string(screenshot, config='--psm 6 digits')
-
-            # 전처리: 불필요한 문자 제거 및 포맷 정리
-            cleaned = (
-                text.replace(',', '')
-                .replace('O', '0')
-                .replace('o', '0')
-                .replace(':', ' ')
-                .replace('㎟', ' ')
-            )
+            if screenshot is None:
+                screenshot = FatValueExtractor.grab(region)
+
+            # OCR로 텍스트 추출 (이진화된 확대 이미지 사용)
+            text = FatValueExtractor.ocr_digits(FatValueExtractor.preprocess(screenshot))
 
-            candidates = re.findall(r'\d+(?:\.\d+)?', cleaned)
+            # 전처리: 불필요한 문자 제거 및 포맷 정리 (한 번의 변환으로 처리)
+            cleaned = text.translate(_OCR_CLEANUP)
+
+            candidates = _NUMBER_RE.findall(cleaned)
 
             values = []
             for candidate in candidates:
@@ -155,11 +363,22 @@ class FatValueExtractor:
     @staticmethod
     def extract_fat_values():
         """두 영역에서 지방값 추출"""
+        # 두 영역 화면 캡처 (가능하면 한 번의 캡처로 처리)
+        try:
+            shot1, shot2 = FatValueExtractor.grab_regions([REGION_1, REGION_2])
+        except Exception as e:
+            # 일괄 캡처에 실패하면 영역마다 따로 캡처하도록 넘김 (한 영역이 실패해도 다른 영역은 시도)
+            print(f"영역 일괄 캡처 오류: {e}")
+            shot1, shot2 = None, None
+
         # 영역 1에서 추출
-        sub1, vis1 = FatValueExtractor.extract_numbers_from_region(REGION_1)
+        sub1, vis1 = FatValueExtractor.extract_numbers_from_region(REGION_1, shot1)
 
-        # 영역 2에서 추출
-        sub2, vis2 = FatValueExtractor.extract_numbers_from_region(REGION_2)
+        # 영역 2에서 추출 (영역 1에서 두 값을 모두 얻었으면 OCR 생략)
+        if sub1 is not None and vis1 is not None:
+            sub2, vis2 = None, None
+        else:
+            sub2, vis2 = FatValueExtractor.extract_numbers_from_region(REGION_2, shot2)
 
         # 유효한 값 선택
         subcutaneous = sub1 if sub1 is not None else sub2
@@ -174,13 +393,15 @@ class ResultWindow:
 
     @staticmethod
     def show_result(subcutaneous, visceral, sub_grade, vis_grade, ratio, ratio_grade):
-        """결과 창 표시"""
-        root = tk.Tk()
-        root.title("CT 복부지방 분석 결과")
-        root.geometry("400x300")
+        """결과 창 표시 (GUI 스레드의 루트 아래 창으로 생성)"""
 
-        # 결과 텍스트
-        result_text = f"""
+        def _show(root):
+            window = tk.Toplevel(root)
+            window.title("CT 복부지방 분석 결과")
+            window.geometry("400x300")
+
+            # 결과 텍스트
+            result_text = f"""
         ===== CT 복부지방 분석 결과 =====
 
         피하지방: {subcutaneous:,}㎟ ({sub_grade})
@@ -192,37 +413,42 @@ class ResultWindow:
         ================================
         """
 
-        label = tk.Label(root, text=result_text, font=("맑은 고딕", 12), justify="left")
-        label.pack(pady=20)
-
-        # 판독지 전송 버튼
-        def send_to_report():
-            ReportGenerator.send_to_report(subcutaneous, visceral, sub_grade, vis_grade, ratio, ratio_grade)
-            root.destroy()
-
-        btn_send = tk.Button(
-            root,
-            text="판독지로 전송 (R)",
-            command=send_to_report,
-            font=("맑은 고딕", 11),
-            bg="#4CAF50",
-            fg="white",
-            padx=20,
-            pady=10,
-        )
-        btn_send.pack(pady=10)
-
-        btn_close = tk.Button(
-            root,
-            text="닫기",
-            command=root.destroy,
-            font=("맑은 고딕", 11),
-            padx=20,
-            pady=10,
-        )
-        btn_close.pack()
+            label = tk.Label(window, text=result_text, font=("맑은 고딕", 12), justify="left")
+            label.pack(pady=20)
+
+            # 판독지 전송 버튼
+            def send_to_report():
+                # 판독문 입력은 오래 걸리므로 GUI 스레드(다른 창/오버레이 처리)를 막지 않도록 별도 스레드에서 실행
+                btn_send.config(state="disabled")
+                threading.Thread(target=_send_and_close, daemon=True).start()
+
+            def _send_and_close():
+                ReportGenerator.send_to_report(subcutaneous, visceral, sub_grade, vis_grade, ratio, ratio_grade)
+                TkDispatcher.run(lambda root: window.destroy())
+
+            btn_send = tk.Button(
+                window,
+                text="판독지로 전송 (R)",
+                command=send_to_report,
+                font=("맑은 고딕", 11),
+                bg="#4CAF50",
+                fg="white",
+                padx=20,
+                pady=10,
+            )
+            btn_send.pack(pady=10)
+
+            btn_close = tk.Button(
+                window,
+                text="닫기",
+                command=window.destroy,
+                font=("맑은 고딕", 11),
+                padx=20,
+                pady=10,
+            )
+            btn_close.pack()
 
-        root.mainloop()
+        TkDispatcher.run(_show)
 
 
 # ==================== 판독지 작성 ====================
@@ -247,7 +473,7 @@ class ReportGenerator:
 
     @staticmethod
     def send_to_report(subcutaneous, visceral, sub_grade, vis_grade, ratio, ratio_grade):
-        """판독지로 전송"""
+        """판독지로 전송 (GUI 스레드가 아닌 작업 스레드에서 호출)"""
         try:
             # 판독창 열기 (r 키)
             pyautogui.press('r')
@@ -261,10 +487,10 @@ class ReportGenerator:
             # 판독문 입력
             pyautogui.write(report_text, interval=0.01)
 
-            messagebox.showinfo("완료", "판독지 전송이 완료되었습니다!")
+            TkDispatcher.run(lambda root: messagebox.showinfo("완료", "판독지 전송이 완료되었습니다!", parent=root))
 
         except Exception as e:
-            messagebox.showerror("오류", f"판독지 전송 중 오류 발생:\n{e}")
+            TkDispatcher.show_error("오류", f"판독지 전송 중 오류 발생:\n{e}")
 
 
 # ==================== 메인 프로세스 ====================
@@ -284,7 +510,7 @@ class CTAnalyzer:
             subcutaneous, visceral = FatValueExtractor.extract_fat_values()
 
             if subcutaneous is None or visceral is None:
-                messagebox.showerror("오류", "지방값을 추출할 수 없습니다.\n화면 영역 설정을 확인해주세요.")
+                TkDispatcher.show_error("오류", "지방값을 추출할 수 없습니다.\n화면 영역 설정을 확인해주세요.")
                 return
 
             print(f"추출 완료: 피하지방={subcutaneous}, 내장지방={visceral}")
@@ -301,17 +527,55 @@ class CTAnalyzer:
             ResultWindow.show_result(subcutaneous, visceral, sub_grade, vis_grade, ratio, ratio_grade)
 
         except Exception as e:
-            messagebox.showerror("오류", f"분석 중 오류 발생:\n{e}")
+            TkDispatcher.show_error("오류", f"분석 중 오류 발생:\n{e}")
+
+    @staticmethod
+    def worker_loop(requests):
+        """분석 스레드: F12 요청을 하나씩 처리 (화면 캡처 객체가 이 스레드에 유지되어 계속 재사용됨)"""
+        try:
+            while True:
+                if requests.get() is None:
+                    return
+                CTAnalyzer.analyze()
+
+                # 분석 중에 눌린 F12는 무시 (분석이 끝난 뒤 같은 분석이 한 번 더 실행되지 않도록)
+                try:
+                    if requests.get_nowait() is None:
+                        return
+                except queue.Empty:
+                    pass
+        finally:
+            # 이 스레드에서 만든 화면 캡처 객체는 이 스레드에서 해제
+            FatValueExtractor.close()
 
 
 # ==================== 단축키 설정 ====================
 def setup_hotkey():
     """단축키 설정 (***를 F12로 대체)"""
-    keyboard.add_hotkey('F12', lambda: threading.Thread(target=CTAnalyzer.analyze).start())
+    # 단축키 대기 중에 OCR 엔진을 백그라운드에서 미리 로드
+    threading.Thread(target=FatValueExtractor.warm_up, daemon=True).start()
+
+    # 분석은 전용 스레드 하나에서 순서대로 실행 (F12마다 새 스레드를 만들지 않음)
+    requests = queue.Queue(maxsize=1)
+    worker = threading.Thread(target=CTAnalyzer.worker_loop, args=(requests,), daemon=True)
+    worker.start()
+
+    def request_analysis():
+        try:
+            requests.put_nowait(True)
+        except queue.Full:
+            # 이미 대기 중인 요청이 있으면 무시 (연타로 같은 분석이 쌓이지 않도록)
+            pass
+
+    keyboard.add_hotkey('F12', request_analysis)
     print("CT 복부지방 자동 판독 프로그램 실행 중...")
     print("F12 키를 눌러 분석을 시작하세요.")
     print("종료하려면 Ctrl+C를 누르세요.")
-    keyboard.wait()
+    try:
+        keyboard.wait()
+    finally:
+        requests.put(None)
+        worker.join()
 
 
 # ==================== 프로그램 실행 ====================
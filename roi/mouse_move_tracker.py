@@ -1,19 +1,37 @@
+import sys
 import threading
 
 from pynput import keyboard, mouse
 
 
+PRINT_INTERVAL = 0.05  # 좌표 출력 간격(초). 이벤트마다 출력하지 않고 이 간격으로 최신 좌표만 출력
+
 stop_event = threading.Event()
+latest_position = None  # 리스너 스레드가 기록하는 가장 최근 마우스 좌표
 
 
 def on_move(x, y):
-    """마우스가 움직일 때마다 좌표를 출력합니다."""
+    """마우스가 움직일 때마다 최신 좌표를 기록합니다."""
+    global latest_position
     if stop_event.is_set():
         # True/False 대신 None을 반환하면 리스너가 계속 유지됩니다.
         # 여기서는 종료 플래그가 설정된 경우만 정지하도록 False 반환.
         return False
 
-    print(f"마우스 좌표: ({x}, {y})")
+    # 초당 수백 번 들어오는 이벤트마다 출력하면 리스너가 밀리므로 좌표만 기록하고 바로 반환
+    latest_position = (x, y)
+
+
+def print_positions():
+    """기록된 최신 좌표가 바뀌었을 때만 일정 간격으로 출력합니다."""
+    printed = None
+    while not stop_event.wait(PRINT_INTERVAL):
+        position = latest_position
+        if position is None or position == printed:
+            continue
+        printed = position
+        sys.stdout.write(f"마우스 좌표: ({position[0]}, {position[1]})\n")
+        sys.stdout.flush()
 
 
 def on_key_press(key):
@@ -31,9 +49,11 @@ def main():
 
     mouse_listener = mouse.Listener(on_move=on_move)
     keyboard_listener = keyboard.Listener(on_press=on_key_press)
+    printer = threading.Thread(target=print_positions, daemon=True)
 
     mouse_listener.start()
     keyboard_listener.start()
+    printer.start()
 
     try:
         stop_event.wait()